@@ -17,19 +17,38 @@ Usage:
 import re
 import sys
 import argparse
+import fnmatch
+from bisect import bisect_left
 from collections import defaultdict
 
-SEPS = {'.', '/'}
+SEP_SPLIT_RE = re.compile(r'([./])')
 SEL_RE = re.compile(r'''^\s*select\s+-name\s+"([^"]+)"\s+-type\s+Inst\s+-highlight\s+(\d+)\s*$''')
 CAT_RE = re.compile(r'''^\s*#\s*Category\s+(\d+).*\bcolor\s+(\d+)''')
-# split into: head (up to before last digit-run), digits (last run), suffix (non-digits after)
-TAIL_NUM_RE = re.compile(r'^(.*?)(\d+)(\D*)$')
+GLOB_META_RE = re.compile(r'[*?\[]')
+
+def split_tail(nm):
+    """
+    Split nm into (head, digits, suffix) around its LAST digit run, or None if it has no digits.
+    Plain index walk from the end instead of a backtracking regex.
+    """
+    i = len(nm)
+    while i > 0 and not nm[i-1].isdecimal():
+        i -= 1
+    if i == 0:
+        return None
+    j = i - 1
+    while j > 0 and nm[j-1].isdecimal():
+        j -= 1
+    return nm[:j], nm[j:i], nm[i:]
 
 def parse_file(path):
     """
     Returns:
       order: [category_id as str in encountered order]
-      cats:  {cat_id: {"highlight": int, "names": [str, ...]}}
+      cats:  {cat_id: {"highlight": int, "bit": int, "names": [str, ...],
+                       "parsed": {name: (head, digits, suffix)}}}
+             ("bit" is 1 << encounter index, used for category bitmasks;
+              "parsed" holds the trailing-number split of every name that has digits)
       header_lines: initial comment lines (kept, optional)
     """
     cats = {}
@@ -40,120 +59,141 @@ def parse_file(path):
 
     with open(path, 'r', encoding='utf-8') as f:
         for line in f:
-            mcat = CAT_RE.match(line)
+            # A line is never both kinds; only run the regex its first word can match
+            ls = line.lstrip()
+            mcat = CAT_RE.match(line) if ls.startswith('#') else None
             if mcat:
                 cur_cat = mcat.group(1)
                 cur_high = int(mcat.group(2))
                 if cur_cat not in cats:
-                    cats[cur_cat] = {"highlight": cur_high, "names": []}
+                    cats[cur_cat] = {"highlight": cur_high, "bit": 1 << len(order), "names": [], "parsed": {}}
                     order.append(cur_cat)
                 else:
                     # If repeated headers appear, keep first highlight
                     cats[cur_cat]["highlight"] = cats[cur_cat].get("highlight", cur_high)
                 continue
 
-            msel = SEL_RE.match(line)
+            msel = SEL_RE.match(line) if ls.startswith('select') else None
             if msel and cur_cat is not None:
                 name = msel.group(1)
                 cats[cur_cat]["names"].append(name)
+                tail = split_tail(name)
+                if tail is not None:
+                    cats[cur_cat]["parsed"][name] = tail
             else:
                 # Preserve very first comment lines only for reference
-                if not order and (line.lstrip().startswith('#') or not line.strip()):
+                if not order and (ls.startswith('#') or not ls):
                     header_lines.append(line.rstrip('\n'))
 
     return order, cats, header_lines
 
-def sep_prefixes(name):
-    """All prefixes ending exactly at '.' or '/' (short → long)."""
-    out = []
-    for i, ch in enumerate(name):
-        if ch in SEPS:
-            out.append(name[:i+1])
-    return out
+def sep_tokens(name):
+    """
+    Split `name` into hierarchy tokens that each end exactly at '.' or '/'.
+    Joining the first k tokens gives the k-th separator prefix; any trailing
+    part without a separator is dropped.
+    """
+    parts = SEP_SPLIT_RE.split(name)
+    return [parts[i] + parts[i+1] for i in range(0, len(parts) - 1, 2)]
 
-def build_sep_prefix_index(cats):
+def build_sep_tokens_index(all_names):
     """
-    Map every hierarchy prefix (ending at '.' or '/') -> set of categories using that prefix.
+    Tokenize every distinct name once: {name: tuple of interned sep tokens}.
+    Names share long hierarchy chains, so interning keeps one copy of each token
+    and makes trie key lookups cheap.
     """
-    pref_to_cats = defaultdict(set)
+    return {nm: tuple(sys.intern(t) for t in sep_tokens(nm)) for nm in all_names}
+
+def build_sep_prefix_trie(cats, tokens_by_name):
+    """
+    Trie over separator tokens. Each node is [mask, children] where `mask` ORs the
+    bit of every category having a name under that hierarchy prefix.
+    """
+    root = [0, {}]
     for cat, d in cats.items():
+        bit = d["bit"]
         for nm in d["names"]:
-            for p in sep_prefixes(nm):
-                pref_to_cats[p].add(cat)
-    return pref_to_cats
-
-def compute_unique_prefixes_for_category(cat, names, pref_to_cats):
+            node = root
+            for tok in tokens_by_name[nm]:
+                child = node[1].get(tok)
+                if child is None:
+                    child = node[1][tok] = [0, {}]
+                child[0] |= bit
+                node = child
+    return root
+
+def compute_unique_prefixes_for_category(cat_bit, names, trie, tokens_by_name):
     """
-    For each name, find the SHORTEST prefix-at-separator unique to `cat`.
-    Then reduce the set (drop any prefix covered by a shorter already chosen).
+    For each name, walk the trie down to the SHORTEST prefix-at-separator whose mask is
+    exactly `cat_bit`. A walk never continues below such a node, so no kept prefix
+    can be covered by another one.
     Returns (prefixes:set[str], covered_names:set[str])
     """
-    candidates = []  # (prefix, len)
-    for nm in names:
-        uniq = None
-        for p in sep_prefixes(nm):
-            if pref_to_cats[p] == {cat}:
-                uniq = p
-                break  # shortest unique
-        if uniq:
-            candidates.append(uniq)
-
-    # dedup and minimize coverage: keep shortest that are not subsumed by another kept prefix
-    candidates = sorted(set(candidates), key=len)
-    kept = []
-    for p in candidates:
-        if not any(p.startswith(k) for k in kept):
-            kept.append(p)
-
-    # compute coverage
+    kept = set()
     covered = set()
     for nm in names:
-        if any(nm.startswith(k) for k in kept):
-            covered.add(nm)
-
-    return set(kept), covered
-
-def build_trailing_number_index(all_names_by_cat):
+        node = trie
+        plen = 0
+        for tok in tokens_by_name[nm]:
+            node = node[1][tok]
+            plen += len(tok)
+            if node[0] == cat_bit:
+                kept.add(nm[:plen])
+                covered.add(nm)
+                break
+
+    return kept, covered
+
+def build_trailing_number_index(cats):
     """
     Build index for trailing-number grouping:
       key = (head, suffix) where name == head + digits + suffix
       val = list of (cat, full_name, digits_str)
     """
     idx = defaultdict(list)
-    for cat, names in all_names_by_cat.items():
-        for nm in names:
-            m = TAIL_NUM_RE.match(nm)
-            if not m:
-                continue
-            head, digits, suffix = m.groups()
+    for cat, d in cats.items():
+        for nm, (head, digits, suffix) in d["parsed"].items():
             idx[(head, suffix)].append((cat, nm, digits))
     return idx
 
-def prefixes_of_numbers_set(nums):
-    """Return a set of ALL possible leading prefixes of each numeric string in nums."""
-    s = set()
+def build_digit_trie(nums):
+    """Character trie (nested dicts) over the numeric strings in nums."""
+    trie = {}
     for n in nums:
-        for L in range(1, len(n)+1):
-            s.add(n[:L])
-    return s
+        node = trie
+        for ch in n:
+            node = node.setdefault(ch, {})
+    return trie
 
-def make_digit_merges_for_category(cat, names_left, trailing_idx):
+def shortest_unseen_prefix_len(d, trie):
+    """
+    Length of the shortest prefix of d that is not a prefix of any number in the trie,
+    or None if every prefix of d is taken.
+    """
+    node = trie
+    for L, ch in enumerate(d, 1):
+        node = node.get(ch)
+        if node is None:
+            return L
+    return None
+
+def make_digit_merges_for_category(cat, names_left, parsed, trailing_idx):
     """
     For each (head, suffix) group, compute minimal digit prefixes that exclude other categories.
     Returns:
-      patterns: set of pattern strings like head + dprefix + '*' + suffix
+      patterns: {pattern string like head + dprefix + '*' + suffix: names it was built from}
       covered_names: set of names these patterns cover
     """
     # Map from (head, suffix) to our list of (name, digits)
     groups = defaultdict(list)
     for nm in names_left:
-        m = TAIL_NUM_RE.match(nm)
-        if not m:
+        tail = parsed.get(nm)
+        if tail is None:
             continue
-        head, digits, suffix = m.groups()
+        head, digits, suffix = tail
         groups[(head, suffix)].append((nm, digits))
 
-    patterns = set()
+    patterns = {}
     covered = set()
 
     for key, our_list in groups.items():
@@ -162,41 +202,82 @@ def make_digit_merges_for_category(cat, names_left, trailing_idx):
         all_entries = trailing_idx.get(key, [])
         # Other categories' numbers for conflict checks
         other_nums = [d for (c2, _nm2, d) in all_entries if c2 != cat]
-        other_pref = prefixes_of_numbers_set(other_nums)
+        other_trie = build_digit_trie(other_nums)
 
         # Determine per-number minimal safe prefix
         dprefix_to_names = defaultdict(list)
         for nm, d in our_list:
             # Find shortest prefix of d that is NOT used by other categories
-            L = 1
-            while L <= len(d) and d[:L] in other_pref:
-                L += 1
+            L = shortest_unseen_prefix_len(d, other_trie)
             # If even full length conflicts (means exact same number appears in other cat),
             # then no safe merge; we will leave this as an explicit name.
-            if L > len(d):
+            if L is None:
                 continue
             dprefix_to_names[d[:L]].append(nm)
 
         # Emit patterns only for dprefixes that cover >=2 names
         for dp, nmlist in dprefix_to_names.items():
             if len(nmlist) >= 2:
-                patterns.add(f'{head}{dp}*{suffix}')
+                patterns[f'{head}{dp}*{suffix}'] = nmlist
                 covered.update(nmlist)
 
     return patterns, covered
 
+def build_name_masks(cats):
+    """Map every distinct name -> OR of the bits of the categories it appears in."""
+    name_masks = defaultdict(int)
+    for d in cats.values():
+        bit = d["bit"]
+        for nm in d["names"]:
+            name_masks[nm] |= bit
+    return name_masks
+
+def pattern_is_safe(patt, cat_bit, sorted_names, name_masks):
+    """
+    True if glob `patt` ("<prefix>*<suffix>") matches some name of category `cat_bit`
+    and no name outside it.
+    Such a name starts with <prefix> and ends with <suffix> without overlap, so the only
+    candidates are one contiguous run of `sorted_names`; no globbing needed.
+    Falls back to fnmatch if the fixed parts themselves contain glob metacharacters.
+    """
+    prefix, _, suffix = patt.partition('*')
+    hits_own = False
+    if GLOB_META_RE.search(prefix) or GLOB_META_RE.search(suffix):
+        match = re.compile(fnmatch.translate(patt)).match
+        for nm in sorted_names:
+            if match(nm):
+                if name_masks[nm] & ~cat_bit:
+                    return False
+                hits_own = True
+        return hits_own
+
+    min_len = len(prefix) + len(suffix)
+    i = bisect_left(sorted_names, prefix)
+    while i < len(sorted_names) and sorted_names[i].startswith(prefix):
+        nm = sorted_names[i]
+        if len(nm) >= min_len and nm.endswith(suffix):
+            if name_masks[nm] & ~cat_bit:
+                return False
+            hits_own = True
+        i += 1
+    return hits_own
+
 def write_output(path, header_lines, order, cats, unique_by_cat, digit_patterns_by_cat, leftovers_by_cat):
     total_in = sum(len(cats[c]["names"]) for c in order)
     total_out = 0
 
-    with open(path, 'w', encoding='utf-8') as out:
-        out.write('# Auto-compressed Tcl selects (hierarchy + numeric merges)\n')
-        out.write(f'# Original lines: {total_in}\n')
-        out.write(f'# Generated by compress_tcl_selects.py\n')
+    # Binary mode: text is encoded to UTF-8 once per block rather than per write
+    with open(path, 'wb', buffering=1 << 20) as out:
+        header = [
+            '# Auto-compressed Tcl selects (hierarchy + numeric merges)\n',
+            f'# Original lines: {total_in}\n',
+            f'# Generated by compress_tcl_selects.py\n',
+        ]
         if header_lines:
             for h in header_lines:
-                out.write(f'# {h}\n')
-        out.write('\n')
+                header.append(f'# {h}\n')
+        header.append('\n')
+        out.write(''.join(header).encode('utf-8'))
 
         for cat in order:
             hlt = cats[cat]["highlight"]
@@ -204,14 +285,15 @@ def write_output(path, header_lines, order, cats, unique_by_cat, digit_patterns_
             dpatts = sorted(digit_patterns_by_cat[cat])
             leftovers = sorted(leftovers_by_cat[cat])
 
-            out.write(f'# Category {cat} → color {hlt}\n')
-
+            # Collect the whole category and emit it with a single write
+            parts = [f'# Category {cat} → color {hlt}\n']
             for p in uprefs:
-                out.write(f'select -name "{p}*" -type Inst -highlight {hlt}\n')
+                parts.append(f'select -name "{p}*" -type Inst -highlight {hlt}\n')
             for patt in dpatts:
-                out.write(f'select -name "{patt}" -type Inst -highlight {hlt}\n')
+                parts.append(f'select -name "{patt}" -type Inst -highlight {hlt}\n')
             for nm in leftovers:
-                out.write(f'select -name "{nm}" -type Inst -highlight {hlt}\n')
+                parts.append(f'select -name "{nm}" -type Inst -highlight {hlt}\n')
+            out.write(''.join(parts).encode('utf-8'))
 
             total_out += len(uprefs) + len(dpatts) + len(leftovers)
 
@@ -229,20 +311,20 @@ def main():
         sys.exit(1)
 
     # 1) Build convenience views
-    all_names_by_cat = {c: set(d["names"]) for c, d in cats.items()}
-    all_names = set().union(*all_names_by_cat.values())
+    name_masks = build_name_masks(cats)
 
     # 2) Unique hierarchy prefixes (A)
-    pref_to_cats = build_sep_prefix_index(cats)
+    tokens_by_name = build_sep_tokens_index(name_masks)
+    sep_trie = build_sep_prefix_trie(cats, tokens_by_name)
     unique_by_cat = {}
     covered_by_unique = {}
     for cat in order:
-        up, cov = compute_unique_prefixes_for_category(cat, cats[cat]["names"], pref_to_cats)
+        up, cov = compute_unique_prefixes_for_category(cats[cat]["bit"], cats[cat]["names"], sep_trie, tokens_by_name)
         unique_by_cat[cat] = up
         covered_by_unique[cat] = cov
 
     # 3) Numeric merges for the remainder (B)
-    trailing_idx = build_trailing_number_index(all_names_by_cat)
+    trailing_idx = build_trailing_number_index(cats)
     digit_patterns_by_cat = {}
     covered_by_digits = {}
     leftovers_by_cat = {}
@@ -252,7 +334,7 @@ def main():
         names_left = names - covered_by_unique[cat]
 
         dpatterns, dcovered = make_digit_merges_for_category(
-            cat, names_left, trailing_idx
+            cat, names_left, cats[cat]["parsed"], trailing_idx
         )
         digit_patterns_by_cat[cat] = dpatterns
         covered_by_digits[cat] = dcovered
@@ -262,23 +344,18 @@ def main():
 
     # 5) Final safety check: ensure no digit pattern crosses categories (defensive)
     #    (They shouldn’t, but we verify by matching against the dataset.)
-    #    We only use patterns of form "<prefix>*<suffix>" where <prefix> is the whole head+dprefix.
-    import fnmatch
+    #    A pattern must also match its own names: glob metacharacters in a name
+    #    (e.g. bus bits "core[12]" -> "core[1*]") can make it miss them entirely.
+    sorted_names = sorted(name_masks)
     for cat in order:
+        cat_bit = cats[cat]["bit"]
         safe_patts = set()
-        for patt in digit_patterns_by_cat[cat]:
-            cats_hit = set()
-            for other_cat, names in all_names_by_cat.items():
-                for nm in names:
-                    if fnmatch.fnmatchcase(nm, patt):
-                        cats_hit.add(other_cat)
-                        if len(cats_hit) > 1:
-                            break
-                if len(cats_hit) > 1:
-                    break
-            if cats_hit == {cat}:
+        for patt, nmlist in digit_patterns_by_cat[cat].items():
+            if pattern_is_safe(patt, cat_bit, sorted_names, name_masks):
                 safe_patts.add(patt)
-        digit_patterns_by_cat[cat] = safe_patts  # drop any unsafe (should be none)
+            else:  # dropped: emit its names explicitly instead
+                leftovers_by_cat[cat].extend(nmlist)
+        digit_patterns_by_cat[cat] = safe_patts
 
     # 6) Write output
     write_output(args.output, header_lines, order, cats, unique_by_cat, digit_patterns_by_cat, leftovers_by_cat)
@@ -2,7 +2,12 @@ import openroad
 from openroad import Design, Tech, Timing
 import rcx
 import os
+import re
 import odb
+from bisect import bisect_left
+
+import numpy as np
+from numba import njit
 
 
 openroad.openroad_version()
@@ -30,15 +35,11 @@ X_TOLERANCE = 10000  # 10um in database units (assuming 1000 DBU per micron)
 Y_TOLERANCE = 1000  # 1um in database units
 
 
-def distance_within_tolerance(pos1, pos2, x_tol, y_tol):
-    """Check if two positions are within the specified tolerances"""
-    x_diff = abs(pos1[0] - pos2[0])
-    y_diff = abs(pos1[1] - pos2[1])
-    return x_diff <= x_tol and y_diff <= y_tol
-
-
-# Gather all instances with their positions
-instances = []
+# Gather all instances with their positions, structure-of-arrays style:
+# names stay in a list, coordinates go into int64 arrays for vectorized tests
+names = []
+x_list = []
+y_list = []
 for inst in design.getBlock().getInsts():
     name = inst.getName()
     if (
@@ -50,53 +51,121 @@ for inst in design.getBlock().getInsts():
         continue
 
     x, y = inst.getLocation()
-    instances.append({"name": name, "x": x, "y": y, "clustered": False})
-
-print(f"Found {len(instances)} instances to cluster")
+    names.append(name)
+    x_list.append(x)
+    y_list.append(y)
 
-# Clustering algorithm
-clusters = []
-cluster_id = 0
+print(f"Found {len(names)} instances to cluster")
 
-for i, inst in enumerate(instances):
-    if inst["clustered"]:
-        continue
+xs = np.array(x_list, dtype=np.int64)
+ys = np.array(y_list, dtype=np.int64)
 
-    # Start a new cluster
-    cluster = [inst["name"]]
-    inst["clustered"] = True
 
-    # Find all instances within tolerance of this one
-    for j, other_inst in enumerate(instances):
-        if i == j or other_inst["clustered"]:
+@njit(cache=True)
+def cluster_ids(xs, ys, x_tol, y_tol):
+    """
+    Seed-ordered clustering: each still-unclustered instance starts a new cluster that takes
+    every unclustered instance within tolerance of it. Returns the cluster id of each instance.
+    Instances are bucketed into tolerance-sized grid cells (sorted by cell key), so a seed only
+    looks at its own cell and the 8 neighbors.
+    """
+    n = xs.size
+    cid = np.full(n, -1, np.int64)
+    if n == 0:
+        return cid
+
+    # Flatten (cell_x, cell_y) into one sortable key; the +1/+3 padding keeps neighbor keys distinct
+    cell_x = xs // x_tol
+    cell_y = ys // y_tol
+    min_cx = cell_x.min()
+    min_cy = cell_y.min()
+    width = cell_y.max() - min_cy + 3
+    keys = (cell_x - min_cx + 1) * width + (cell_y - min_cy + 1)
+    order = np.argsort(keys, kind="mergesort")
+    sorted_keys = keys[order]
+
+    next_id = 0
+    for i in range(n):
+        if cid[i] >= 0:
             continue
 
-        if distance_within_tolerance(
-            (inst["x"], inst["y"]),
-            (other_inst["x"], other_inst["y"]),
-            X_TOLERANCE,
-            Y_TOLERANCE,
-        ):
-            cluster.append(other_inst["name"])
-            other_inst["clustered"] = True
+        # Start a new cluster
+        cid[i] = next_id
+        for dx in range(-1, 2):
+            for dy in range(-1, 2):
+                key = keys[i] + dx * width + dy
+                lo = np.searchsorted(sorted_keys, key)
+                hi = np.searchsorted(sorted_keys, key, side="right")
+                for p in range(lo, hi):
+                    j = order[p]
+                    if cid[j] < 0 and abs(xs[j] - xs[i]) <= x_tol and abs(ys[j] - ys[i]) <= y_tol:
+                        cid[j] = next_id
+        next_id += 1
+    return cid
 
-    clusters.append(cluster)
-    cluster_id += 1
+
+# Clustering algorithm
+cid = cluster_ids(xs, ys, X_TOLERANCE, Y_TOLERANCE)
+
+# Seeds have the lowest index in their cluster, so walking instances in order
+# keeps the seed first and the rest in instance order
+clusters = [[] for _ in range(int(cid.max()) + 1 if len(cid) else 0)]
+for idx, c in enumerate(cid.tolist()):
+    clusters[c].append(names[idx])
 
 print(f"Created {len(clusters)} clusters")
 
 
+# Candidate prefixes end right after a '/', '[', '.' or digit; the last token may be a plain tail
+PREFIX_TOKEN_RE = re.compile(r'[^/\[.\d]*[/\[.\d]|[^/\[.\d]+$')
+REMOVED = -1  # trie bucket for names already replaced by a representative
+
+
+def build_prefix_trie(clusters):
+    """
+    Build a trie over the delimiter tokens of every instance name.
+    Each node is [cluster_counts, children], where cluster_counts maps
+    cluster index -> number of names below that prefix.
+    """
+    root = [{}, {}]
+    for cluster_idx, cluster in enumerate(clusters):
+        for name in cluster:
+            node = root
+            for tok in PREFIX_TOKEN_RE.findall(name):
+                child = node[1].get(tok)
+                if child is None:
+                    child = node[1][tok] = [{}, {}]
+                counts = child[0]
+                counts[cluster_idx] = counts.get(cluster_idx, 0) + 1
+                node = child
+    return root
+
+
+def retire_name(trie, name, cluster_idx):
+    """Move a name's counts from its cluster to the REMOVED bucket."""
+    node = trie
+    for tok in PREFIX_TOKEN_RE.findall(name):
+        node = node[1][tok]
+        counts = node[0]
+        if counts[cluster_idx] == 1:
+            del counts[cluster_idx]
+        else:
+            counts[cluster_idx] -= 1
+        counts[REMOVED] = counts.get(REMOVED, 0) + 1
+
+
 def reduce_cluster_names(clusters):
     """
     Iteratively reduce instance names by finding smallest unique prefixes and removing
     instances that share the same prefix. Uses hierarchical delimiter '/'.
-    Prefixes must be unique to the cluster - they cannot match any string in other clusters.
+    Prefixes must be unique to the cluster - they cannot match any string in other clusters
+    (or any instance of this cluster that was already replaced by a representative).
     """
     reduced_clusters = []
     total_iterations = 0
     total_prefixes_found = 0
     total_instances_matched = 0
-    rejected_prefixes = set()  # Keep track of rejected prefixes to avoid retrying
+    rejected_prefixes = set()  # distinct prefixes rejected for matching other clusters (stats only)
     
     print("\n=== CLUSTER REDUCTION STATISTICS ===")
     print(f"Starting reduction process with {len(clusters)} clusters")
@@ -104,10 +173,9 @@ def reduce_cluster_names(clusters):
     # Sort clusters by size (largest first)
     sorted_clusters = sorted(clusters, key=len, reverse=True)
     
-    # Create a flat list of all instance names across all clusters for uniqueness checking
-    all_instances = []
-    for cluster in sorted_clusters:
-        all_instances.extend(cluster)
+    # One trie over all instance names answers both "how many remaining instances of this
+    # cluster share the prefix" and "does anything else share it" per node
+    prefix_trie = build_prefix_trie(sorted_clusters)
     
     # Print initial cluster size statistics
     initial_sizes = [len(cluster) for cluster in sorted_clusters]
@@ -129,105 +197,84 @@ def reduce_cluster_names(clusters):
         # Sort instance names by length (largest first) within the cluster
         sorted_cluster = sorted(cluster, key=len, reverse=True)
         
-        # Work with a copy of the cluster that we'll modify
-        remaining_instances = sorted_cluster.copy()
+        # Track what is left as a set; seeds are taken in sorted_cluster order through a
+        # cursor that only moves forward, since removed instances never come back
+        remaining_set = set(sorted_cluster)
+        seed_pos = 0
+        
+        # In lexicographic order every name sharing a prefix sits in one contiguous run
+        lex_sorted = sorted(cluster)
         final_representatives = []
         cluster_iterations = 0
         
         # Keep iterating until no instances remain
-        while remaining_instances:
+        while remaining_set:
             cluster_iterations += 1
             total_iterations += 1
             
             # Pick the first remaining instance that doesn't have a wildcard
-            current_instance = None
-            for instance in remaining_instances:
-                if '*' not in instance:
-                    current_instance = instance
-                    break
+            while seed_pos < len(sorted_cluster) and (
+                sorted_cluster[seed_pos] not in remaining_set or '*' in sorted_cluster[seed_pos]
+            ):
+                seed_pos += 1
             
             # If no instance without wildcard found, we're done with this cluster
-            if current_instance is None:
+            if seed_pos == len(sorted_cluster):
                 break
-            parts = current_instance.split('/')
+            current_instance = sorted_cluster[seed_pos]
             
             # Find the smallest prefix that uniquely identifies this instance
             found_unique_prefix = None
             
-            # Generate prefix lengths: increase until next forward slash, open square bracket, or digit
-            prefix_lengths = []
-            
-            # Find positions of forward slashes, open square brackets, dots, and digits
-            delimiter_positions = []
-            for i, char in enumerate(current_instance):
-                if char == '/' or char == '[' or char == '.' or char.isdigit():
-                    delimiter_positions.append(i)
+            # Prefixes end after each forward slash, open square bracket, dot, or digit,
+            # excluding the entire string
+            tokens = PREFIX_TOKEN_RE.findall(current_instance)
             
-            if delimiter_positions:
-                # Start with first delimiter position + 1 (include the delimiter)
-                for pos in delimiter_positions:
-                    prefix_length = pos + 1
-                    # Only add if it's not the entire string
-                    if prefix_length < len(current_instance):
-                        prefix_lengths.append(prefix_length)
-            else:
-                # No delimiters found, skip this instance (prefix would be the whole string)
-                prefix_lengths = []
-            
-            # If no prefix lengths generated (no delimiters), skip this instance
-            if not prefix_lengths:
+            # No delimiters before the end of the name, skip this instance
+            if len(tokens) < 2:
                 final_representatives.append(current_instance)
-                remaining_instances.remove(current_instance)
+                remaining_set.discard(current_instance)
+                retire_name(prefix_trie, current_instance, cluster_idx)
                 continue
             
-            for prefix_len in prefix_lengths:
+            node = prefix_trie
+            prefix_len = 0
+            for tok in tokens[:-1]:
+                node = node[1][tok]
+                prefix_len += len(tok)
                 candidate_prefix = current_instance[:prefix_len]
                 
-                # Skip if this prefix was already rejected
-                if candidate_prefix in rejected_prefixes:
-                    continue
-                
-                # Skip if prefix equals the whole instance (shouldn't happen but safety check)
-                if candidate_prefix == current_instance:
-                    continue
-                
                 print(f"Trying prefix '{candidate_prefix}' (from instance '{current_instance}')")
                 
-                # Check if this prefix matches instances in the current cluster
-                matching_instances_in_cluster = []
-                for other_name in remaining_instances:
-                    if other_name.startswith(candidate_prefix):
-                        matching_instances_in_cluster.append(other_name)
-
-                # Only check other clusters if there's more than one match in current cluster
-                matches_other_clusters = False
-                first_other_match = None
-                if len(matching_instances_in_cluster) > 1:
-                    # Check if this prefix matches any instances in OTHER clusters (stop at first match)
-                    for other_name in all_instances:
-                        if other_name not in remaining_instances and other_name.startswith(candidate_prefix):
-                            matches_other_clusters = True
-                            first_other_match = other_name
-                            break  # Stop at first match
-
-                if matches_other_clusters:
-                    rejected_prefixes.add(candidate_prefix)  # Add to rejected prefixes map
-
-                # Prefix is valid if it matches at least TWO instances in current cluster AND doesn't match any in other clusters
-                if len(matching_instances_in_cluster) >= 2 and not matches_other_clusters:
-                    found_unique_prefix = candidate_prefix
-                    print(f"Accepted prefix '{candidate_prefix}' (from instance '{current_instance}') matching {len(matching_instances_in_cluster)} instances")
+                cluster_counts = node[0]
+                matching_in_cluster = cluster_counts.get(cluster_idx, 0)
+                
+                # Longer prefixes can only match fewer instances in the current cluster
+                if matching_in_cluster < 2:
                     break
+                
+                # Any other bucket means the prefix also matches instances outside the remaining ones
+                if len(cluster_counts) > 1:
+                    rejected_prefixes.add(candidate_prefix)
+                    continue
+                
+                # Prefix matches at least TWO instances in current cluster and nothing else
+                found_unique_prefix = candidate_prefix
+                print(f"Accepted prefix '{candidate_prefix}' (from instance '{current_instance}') matching {matching_in_cluster} instances")
+                break
             
             # Use the cluster-unique prefix (or full name if no cluster-unique prefix found)
             if found_unique_prefix is None:
                 found_unique_prefix = current_instance
             
-            # Remove all instances that start with this prefix (only from current cluster)
+            # Remove all instances that start with this prefix (only from current cluster):
+            # walk the sorted run starting at the prefix instead of scanning the whole cluster
             instances_to_remove = []
-            for instance in remaining_instances:
-                if instance.startswith(found_unique_prefix):
-                    instances_to_remove.append(instance)
+            pos = bisect_left(lex_sorted, found_unique_prefix)
+            while pos < len(lex_sorted) and lex_sorted[pos].startswith(found_unique_prefix):
+                if lex_sorted[pos] in remaining_set:
+                    instances_to_remove.append(lex_sorted[pos])
+                pos += 1
             
             instances_matched = len(instances_to_remove)
             total_prefixes_found += 1
@@ -241,11 +288,13 @@ def reduce_cluster_names(clusters):
                 final_representatives.append(found_unique_prefix + "*")
                 # Remove all instances that match this prefix
                 for instance in instances_to_remove:
-                    remaining_instances.remove(instance)
+                    remaining_set.discard(instance)
+                    retire_name(prefix_trie, instance, cluster_idx)
             else:
                 # Only one instance matches, keep the full instance name and just remove it
                 final_representatives.append(current_instance)
-                remaining_instances.remove(current_instance)
+                remaining_set.discard(current_instance)
+                retire_name(prefix_trie, current_instance, cluster_idx)
             
             # Print statistics every 1000 iterations
             if total_iterations % 1000 == 0:
@@ -294,14 +343,14 @@ def reduce_cluster_names(clusters):
     return reduced_clusters
 
 
-# Save original clusters to file
+# Save original clusters to file (binary mode, one UTF-8 encode per cluster)
 original_output_file = "original_instance_clusters.txt"
-with open(original_output_file, "w") as f:
+with open(original_output_file, "wb", buffering=1 << 20) as f:
     for i, cluster in enumerate(clusters):
-        f.write(f"# Cluster {i}\n")
-        for instance_name in sorted(cluster):
-            f.write(f"{instance_name}\n")
-        f.write("\n")
+        parts = [f"# Cluster {i}\n"]
+        parts.extend(f"{instance_name}\n" for instance_name in sorted(cluster))
+        parts.append("\n")
+        f.write("".join(parts).encode("utf-8"))
 
 print(f"Original clustering results written to {original_output_file}")
 
@@ -311,12 +360,12 @@ reduced_clusters = reduce_cluster_names(clusters)
 
 # Save reduced clusters to file
 reduced_output_file = "reduced_instance_clusters.txt"
-with open(reduced_output_file, "w") as f:
+with open(reduced_output_file, "wb", buffering=1 << 20) as f:
     for i, cluster in enumerate(reduced_clusters):
-        f.write(f"# Cluster {i}\n")
-        for instance_name in sorted(cluster):
-            f.write(f"{instance_name}\n")
-        f.write("\n")
+        parts = [f"# Cluster {i}\n"]
+        parts.extend(f"{instance_name}\n" for instance_name in sorted(cluster))
+        parts.append("\n")
+        f.write("".join(parts).encode("utf-8"))
 
 print(f"Reduced clustering results written to {reduced_output_file}")
 
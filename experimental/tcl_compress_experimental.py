@@ -14,6 +14,8 @@ Usage example (run from a separate script or an interactive shell):
 
     # List all category IDs and how many commands each holds
     print({cid: len(cat.cmds) for cid, cat in tcl.categories.items()})
+    # (tcl.categories is a read-only view; use tcl.add_category(block) /
+    #  tcl.remove_category(cid) to add or drop blocks)
 
     # Example 1 ─ simple replacement
     tcl.substitute(r"/i_mult\.i_multiplier/_", "/mult.u_/")
@@ -29,45 +31,161 @@ Usage example (run from a separate script or an interactive shell):
 """
 
 from difflib import SequenceMatcher
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
 import itertools
-from collections import Counter
 import os
 import re
+import sys
 from pathlib import Path
+from types import MappingProxyType
 from dataclasses import dataclass, field
-from typing import Dict, List, Callable, Iterable, Optional
+from typing import Dict, List, Callable, Iterable, Mapping, Optional, Union
 
 
 # ──────────────── low-level parse helpers ──────────────── #
 
-SEL_RE = re.compile(
-    r'^select\s+-name\s+"(?P<name>[^"]+)"\s+'
-    r'-type\s+(?P<type>\S+)\s+'
-    r'-highlight\s+(?P<hlight>\d+)\s*$'
+# Whitespace is spelled [^\S\n] (and quoted names exclude \n) so that a
+# match never runs past the end of its line.
+_SEL_BODY = (
+    r'select[^\S\n]+-name[^\S\n]+"(?P<name>[^"\n]+)"[^\S\n]+'
+    r'-type[^\S\n]+(?P<type>\S+)[^\S\n]+'
+    r'-highlight[^\S\n]+(?P<hlight>\d+)'
 )
-CAT_RE = re.compile(
-    r'^#\s*Category\s+(?P<cat_id>\d+)\s*\(count=(?P<count>\d+)\)\s*→\s*color\s+(?P<color>\d+)\s*$'
+_CAT_BODY = (
+    r'#[^\S\n]*Category[^\S\n]+(?P<cat_id>\d+)[^\S\n]*\(count=(?P<count>\d+)\)'
+    r'[^\S\n]*→[^\S\n]*color[^\S\n]+(?P<color>\d+)'
 )
-
-@dataclass
+SEL_RE = re.compile(rf'^{_SEL_BODY}[^\S\n]*$')
+CAT_RE = re.compile(rf'^{_CAT_BODY}[^\S\n]*$')
+# both line kinds in one pattern, so a line the fast path in read() doesn't
+# take enters the regex engine once
+LINE_RE = re.compile(rf'^(?:{_SEL_BODY}|{_CAT_BODY})[^\S\n]*$')
+# lookarounds and \A/\Z/\z (3.14+) can see past a name's edge in a joined buffer,
+# and a scoped flag group like (?-m:...) turns off the MULTILINE the bulk pass adds
+_BULK_UNSAFE_RE = re.compile(r'\(\?<?[=!]|\\[AZz]|\(\?[aiLmsux]*-')
+assert all(_BULK_UNSAFE_RE.search(p) for p in (r'a\z', r'(?-m:^core)', r'(?i-m:_\d+_$)'))
+_QUOTE_TRANS = str.maketrans({'"': r'\"'})
+
+@dataclass(slots=True)
 class SelectCmd:
     name: str
     type_: str
     highlight: int
-    raw_line: str                     # original text, for rewrites
 
     def rebuild(self) -> str:
         """Return the Tcl line reflecting current fields."""
-        escaped = self.name.replace('"', r'\"')
-        return f'select -name "{escaped}" -type {self.type_} -highlight {self.highlight}'
+        name = self.name
+        if '"' in name:
+            name = name.translate(_QUOTE_TRANS)
+        return f'select -name "{name}" -type {self.type_} -highlight {self.highlight}'
+
+
+def _raw_name(ln: str) -> str:
+    """-name value of an unparsed select line (names never contain '"')."""
+    q = ln.index('"') + 1
+    return ln[q:ln.index('"', q)]
+
+def _name_of(cmd: Union[str, SelectCmd]) -> str:
+    return _raw_name(cmd) if isinstance(cmd, str) else cmd.name
+
+def _parse_cached(cmds: list, i: int) -> SelectCmd:
+    """Upgrade cmds[i] from a raw line to a SelectCmd in place (before mutating it)."""
+    cmd = cmds[i]
+    if isinstance(cmd, str):
+        m = SEL_RE.match(cmd)
+        cmd = cmds[i] = SelectCmd(
+            name=m["name"],
+            type_=sys.intern(m["type"]),   # a handful of values (Inst, Net, ...)
+            highlight=int(m["hlight"]),
+        )
+    return cmd
+
+class _CrossesName(Exception):
+    pass
 
-@dataclass
+def _bulk_buffer(prog: re.Pattern, names: List[str]):
+    """
+    Join names by "\n" and recompile `prog` with MULTILINE so ^/$ keep their
+    per-name meaning.  Returns (bulk_prog, buf, starts), or None when the
+    pattern can't safely be run over a joined buffer.
+    """
+    if not names or _BULK_UNSAFE_RE.search(prog.pattern):
+        return None
+    buf = "\n".join(names)
+    if buf.count("\n") != len(names) - 1:
+        return None
+    bulk = re.compile(prog.pattern, prog.flags | re.MULTILINE)
+    starts = list(itertools.accumulate((len(n) + 1 for n in names[:-1]), initial=0))
+    return bulk, buf, starts
+
+def _bulk_subn(prog: re.Pattern, repl, names: List[str]):
+    """
+    Run one `sub` over all names joined by "\n" instead of one `subn` per name.
+    A match or replacement that touches a "\n" aborts.  Returns
+    [(new_name, n), ...], or None when the pattern can't safely be run this
+    way (caller falls back to per-name subn).  A callable `repl` always falls
+    back, so it is never called twice for the same match.
+    """
+    if callable(repl):
+        return None
+    joined = _bulk_buffer(prog, names)
+    if joined is None:
+        return None
+    bulk, buf, starts = joined
+    hits = [0] * len(names)
+    literal = "\\" not in repl
+    if not literal:
+        prog.sub(repl, "")   # parse the template now, so a bad one raises even with no hits
+
+    def _repl(m: re.Match) -> str:
+        out = repl if literal else m.expand(repl)
+        if "\n" in m[0] or "\n" in out:
+            raise _CrossesName
+        hits[bisect_right(starts, m.start()) - 1] += 1
+        return out
+
+    try:
+        new_names = bulk.sub(_repl, buf).split("\n")
+    except _CrossesName:
+        return None
+    return list(zip(new_names, hits))
+
+def _bulk_search(prog: re.Pattern, names: List[str]):
+    """
+    One `finditer` over the joined names instead of one `search` per name.
+    Returns a per-name hit flag list, or None if the pattern can't run this
+    way or a match touches a "\n" (caller falls back to per-name search).
+    """
+    joined = _bulk_buffer(prog, names)
+    if joined is None:
+        return None
+    bulk, buf, starts = joined
+    hit = [False] * len(names)
+    for m in bulk.finditer(buf):
+        if "\n" in m[0]:
+            return None
+        hit[bisect_right(starts, m.start()) - 1] = True
+    return hit
+
+def _subn_names(prog: re.Pattern, repl, names: List[str], count: int = 0):
+    """[(new_name, n), ...] for `names`; module-level so pool workers can run it."""
+    results = _bulk_subn(prog, repl, names) if count == 0 else None
+    if results is None:
+        results = [prog.subn(repl, name, count=count) for name in names]
+    return results
+
+@dataclass(slots=True)
 class CategoryBlock:
     cat_id: int
     count_hint: int
     color: int
     header_line: str                  # original comment line
-    cmds: List[SelectCmd] = field(default_factory=list)
+    # untouched commands stay as their raw line; only edited ones become SelectCmd
+    cmds: List[Union[str, SelectCmd]] = field(default_factory=list)
+
+    def names(self) -> List[str]:
+        return [_name_of(c) for c in self.cmds]
 
 
 # ──────────────── main document object ──────────────── #
@@ -77,9 +195,32 @@ class TclScript:
 
     def __init__(self) -> None:
         self.pre_comments: List[str] = []          # anything before first category
-        self.categories: Dict[int, CategoryBlock] = {}
+        # blocks in file order for the hot loops, plus an id index for filters
+        self._cats: List[CategoryBlock] = []
+        self._by_id: Dict[int, CategoryBlock] = {}
         self.trailer: List[str] = []               # anything after last category
 
+    @property
+    def categories(self) -> Mapping[int, CategoryBlock]:
+        """Read-only {cat_id: CategoryBlock} view, in file order.
+        Use add_category / remove_category to change the set of blocks."""
+        return MappingProxyType(self._by_id)
+
+    def add_category(self, cat: CategoryBlock) -> None:
+        """Append `cat`, or replace the block with the same cat_id where it stands."""
+        old = self._by_id.get(cat.cat_id)
+        if old is None:
+            self._cats.append(cat)
+        else:                              # repeated id: replace in place, like a dict
+            self._cats[self._cats.index(old)] = cat
+        self._by_id[cat.cat_id] = cat
+
+    def remove_category(self, cat_id: int) -> CategoryBlock:
+        """Drop and return the block with `cat_id` (KeyError if absent)."""
+        cat = self._by_id.pop(cat_id)
+        self._cats.remove(cat)
+        return cat
+
     # ---------- I/O ---------- #
 
     @classmethod
@@ -87,67 +228,103 @@ class TclScript:
         obj = cls()
         current_cat: Optional[CategoryBlock] = None
 
-        with open(path, "r", encoding="utf-8") as f:
-            for line in f:
-                ln = line.rstrip("\n")
-                cat_m = CAT_RE.match(ln)
-                sel_m = SEL_RE.match(ln)
-
-                if cat_m:
-                    current_cat = CategoryBlock(
-                        cat_id=int(cat_m["cat_id"]),
-                        count_hint=int(cat_m["count"]),
-                        color=int(cat_m["color"]),
-                        header_line=ln,
-                    )
-                    obj.categories[current_cat.cat_id] = current_cat
-                elif sel_m and current_cat:
-                    cmd = SelectCmd(
-                        name=sel_m["name"],
-                        type_=sel_m["type"],
-                        highlight=int(sel_m["hlight"]),
-                        raw_line=ln,
-                    )
-                    current_cat.cmds.append(cmd)
-                else:
-                    # line is a comment or blank.  Decide where it belongs:
-                    if current_cat is None:
-                        obj.pre_comments.append(ln)
+        # raw bytes decoded once; text mode's universal newlines done by hand
+        text = Path(path).read_bytes().decode("utf-8")
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+
+        lines = text.split("\n")
+        if lines[-1] == "":                # text ended with "\n" (or was empty)
+            lines.pop()
+
+        line_match = LINE_RE.match
+        cmds = None                        # current_cat.cmds
+        for ln in lines:
+            # fast path: the exact select shape fp_script_gen writes,
+            #   select -name "<name>" -type <Type> -highlight <n>
+            # checked with str slicing only; every line it accepts SEL_RE would too
+            if ln.startswith('select -name "'):
+                q = ln.find('"', 14)
+                h = ln.find(' -highlight ', q)
+                if (q > 14 and ln.startswith('" -type ', q) and h > q + 8
+                        and ln[h + 12:].isdecimal() and ln[q + 8:h].isalnum()):
+                    if cmds is not None:
+                        cmds.append(ln)
                     else:
-                        obj.trailer.append(ln)
+                        obj.pre_comments.append(ln)
+                    continue
+
+            m = line_match(ln)
+            if m is None:
+                # comments, blanks or otherwise unparsed text
+                if current_cat is None:
+                    obj.pre_comments.append(ln)
+                else:
+                    obj.trailer.append(ln)
+            elif m["cat_id"] is not None:
+                current_cat = CategoryBlock(
+                    cat_id=int(m["cat_id"]),
+                    count_hint=int(m["count"]),
+                    color=int(m["color"]),
+                    header_line=ln,
+                )
+                obj.add_category(current_cat)
+                cmds = current_cat.cmds
+            elif cmds is not None:
+                cmds.append(ln)
+            else:
+                obj.pre_comments.append(ln)
         return obj
 
     def write(self, path: str | Path) -> None:
-        with open(path, "w", encoding="utf-8") as f:
-            for ln in self.pre_comments:
-                print(ln, file=f)
+        # collect every output line first and hand them to the file in one write
+        lines: List[str] = list(self.pre_comments)
+        for cat in self._cats:
+            lines.append(cat.header_line)
+            lines.extend(c if isinstance(c, str) else c.rebuild() for c in cat.cmds)
+        lines.extend(self.trailer)
+
+        with open(path, "w", encoding="utf-8", buffering=1 << 20) as f:
+            if lines:
+                f.write("\n".join(lines))
+                f.write("\n")
 
-            for cat in self.categories.values():
-                print(cat.header_line, file=f)
-                for cmd in cat.cmds:
-                    print(cmd.rebuild(), file=f)
+    # ---------- transformation helpers ---------- #
 
-            for ln in self.trailer:
-                print(ln, file=f)
+    def _iter_cats(
+        self,
+        category_filter: Optional[Iterable[int]] = None
+    ) -> Iterable[CategoryBlock]:
+        if category_filter is None:
+            yield from self._cats
+        else:
+            by_id = self._by_id
+            for cid in dict.fromkeys(category_filter):
+                if cid in by_id:
+                    yield by_id[cid]
 
-    # ---------- transformation helpers ---------- #
+    def _iter_positions(
+        self,
+        category_filter: Optional[Iterable[int]] = None
+    ) -> Iterable[tuple]:
+        """Yield (cmds, i) slots; callers read or replace cmds[i] themselves."""
+        for cat in self._iter_cats(category_filter):
+            cmds = cat.cmds
+            for i in range(len(cmds)):
+                yield cmds, i
 
     def _iter_cmds(
         self,
         category_filter: Optional[Iterable[int]] = None
     ) -> Iterable[SelectCmd]:
-        if category_filter is None:
-            for cat in self.categories.values():
-                yield from cat.cmds
-        else:
-            for cid in category_filter:
-                if cid in self.categories:
-                    yield from self.categories[cid].cmds
+        """Yield every command as a SelectCmd (marks them all as edited)."""
+        for cmds, i in self._iter_positions(category_filter):
+            yield _parse_cached(cmds, i)
 
     def substitute(
         self,
-        pattern: str,
-        repl: str,
+        pattern: Union[str, re.Pattern],
+        repl: Union[str, Callable[[re.Match], str]],
         *,
         category_filter: Optional[Iterable[int]] = None,
         count: int = 0,
@@ -155,13 +332,52 @@ class TclScript:
     ) -> int:
         """
         Regex replace in -name strings.  Returns # of substitutions made.
+        With the default count=0 all names go through a single joined-buffer
+        pass when the pattern allows it (see `_bulk_subn`).
+        `pattern` may be a precompiled re.Pattern, in which case `flags` is ignored.
         """
-        prog = re.compile(pattern, flags)
+        prog = pattern if isinstance(pattern, re.Pattern) else re.compile(pattern, flags)
+        slots = list(self._iter_positions(category_filter))
+        names = [_name_of(cmds[i]) for cmds, i in slots]
+        return self._store_subs(slots, _subn_names(prog, repl, names, count))
+
+    def substitute_parallel(
+        self,
+        pattern: Union[str, re.Pattern],
+        repl: Union[str, Callable[[re.Match], str]],
+        *,
+        category_filter: Optional[Iterable[int]] = None,
+        count: int = 0,
+        flags: int = 0,
+        workers: Optional[int] = None,
+        chunk_size: int = 50_000,
+    ) -> int:
+        """
+        Same as `substitute`, but the names are cut into `chunk_size` pieces
+        and run in a process pool (`re` holds the GIL, so threads don't help).
+        `repl` must be picklable: a string or a module-level function.
+        Small inputs that fit in one chunk run in-process.
+        """
+        prog = pattern if isinstance(pattern, re.Pattern) else re.compile(pattern, flags)
+        slots = list(self._iter_positions(category_filter))
+        names = [_name_of(cmds[i]) for cmds, i in slots]
+        chunks = [names[k:k + chunk_size] for k in range(0, len(names), chunk_size)]
+        if len(chunks) <= 1:
+            return self._store_subs(slots, _subn_names(prog, repl, names, count))
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = pool.map(_subn_names, itertools.repeat(prog), itertools.repeat(repl),
+                             chunks, itertools.repeat(count))
+            results = list(itertools.chain.from_iterable(parts))
+        return self._store_subs(slots, results)
+
+    @staticmethod
+    def _store_subs(slots, results) -> int:
+        """Write changed names back into their command slots; returns total n."""
         n_changes = 0
-        for cmd in self._iter_cmds(category_filter):
-            new_name, n = prog.subn(repl, cmd.name, count=count)
+        for (cmds, i), (new_name, n) in zip(slots, results):
             if n:
-                cmd.name = new_name
+                _parse_cached(cmds, i).name = new_name
                 n_changes += n
         return n_changes
 
@@ -170,24 +386,36 @@ class TclScript:
         fn: Callable[[str], str],
         *,
         category_filter: Optional[Iterable[int]] = None,
+        memoize: bool = False,
     ) -> None:
         """
         Apply arbitrary `fn(name)->new_name` to each command’s name.
+        With memoize=True `fn` runs once per distinct name, so it must be pure.
         """
-        for cmd in self._iter_cmds(category_filter):
-            cmd.name = fn(cmd.name)
+        cache: Dict[str, str] = {}
+        for cmds, i in self._iter_positions(category_filter):
+            name = _name_of(cmds[i])
+            if memoize:
+                new_name = cache.get(name)
+                if new_name is None:
+                    new_name = cache[name] = fn(name)
+            else:
+                new_name = fn(name)
+            if new_name != name:
+                _parse_cached(cmds, i).name = new_name
 
     # ---------- convenience ---------- #
 
-    def find(self, pattern: str, *, flags: int = 0,
+    def find(self, pattern: Union[str, re.Pattern], *, flags: int = 0,
              category_filter: Optional[Iterable[int]] = None) -> List[str]:
-        """Return list of names that match regex."""
-        prog = re.compile(pattern, flags)
-        return [
-            cmd.name
-            for cmd in self._iter_cmds(category_filter)
-            if prog.search(cmd.name)
-        ]
+        """Return list of names that match regex (str or precompiled re.Pattern)."""
+        prog = pattern if isinstance(pattern, re.Pattern) else re.compile(pattern, flags)
+        names = [name for cat in self._iter_cats(category_filter)
+                 for name in cat.names()]
+        hit = _bulk_search(prog, names)
+        if hit is None:
+            return [name for name in names if prog.search(name)]
+        return [name for name, h in zip(names, hit) if h]
 
 
 # ── quick-n-dirty CLI (optional) ── #
@@ -196,14 +424,14 @@ class TclScript:
 
 
 import re, itertools
-from collections import Counter
 
 SEG_SPLIT = re.compile(r'[/.]+')          # delimiter class
 
 def shared_leading_segments(names,
                             min_len: int = 1,
                             min_occurs: int = 2,
-                            sample: int | None = None):
+                            sample: int | None = None,
+                            split_cache: Dict[str, List[str]] | None = None):
     """
     Count *prefixes* (built from whole segments) that:
       • start at index 0 of each string
@@ -211,28 +439,56 @@ def shared_leading_segments(names,
       • appear in ≥ `min_occurs` different names
       • have length ≥ `min_len`
     Returns {prefix : hit_count}.
+    Pass the same `split_cache` dict across calls to split each name only once.
     """
     if sample:
         names = names[:sample]
 
-    hits = Counter()
-
+    # segment trie: {token: [hit_count, children]}; a name's prefixes strictly lengthen
+    # down its path, so each node is bumped at most once per name without a seen-set
+    root = {}
     for n in names:
-        segs = SEG_SPLIT.split(n)          # break into path tokens
-        seen = set()                       # avoid double-counting in same name
-        prefix = ''
+        node = root
+        if split_cache is None:
+            segs = SEG_SPLIT.split(n)
+        else:
+            segs = split_cache.get(n)
+            if segs is None:
+                segs = split_cache[n] = SEG_SPLIT.split(n)
         for tok in segs[:-1]:              # ignore trailing '' after final '/'
-            prefix += tok + '/'            # always end with delimiter
-            if len(prefix) >= min_len and prefix not in seen:
-                hits[prefix] += 1
-                seen.add(prefix)
-
-    # keep only prefixes that occur in ≥ min_occurs distinct names
-    return {p: c for p, c in hits.items() if c >= min_occurs}
+            child = node.get(tok)
+            if child is None:
+                child = node[sys.intern(tok)] = [0, {}]
+            child[0] += 1
+            node = child[1]
+
+    # keep only prefixes that occur in ≥ min_occurs distinct names; counts only shrink
+    # going down, so a node below the threshold ends the branch
+    result = {}
+    path: List[str] = []                   # tokens from the root to the current node
+    lens = [0]                             # prefix length at each depth
+    stack = [iter(root.items())]           # one children iterator per depth
+    while stack:
+        for tok, (cnt, sub) in stack[-1]:
+            if cnt < min_occurs:
+                continue
+            path.append(tok)
+            plen = lens[-1] + len(tok) + 1  # always end with delimiter
+            if plen >= min_len:
+                result['/'.join(path) + '/'] = cnt
+            lens.append(plen)
+            stack.append(iter(sub.items()))
+            break
+        else:                              # depth exhausted: back up one level
+            stack.pop()
+            if path:
+                path.pop()
+                lens.pop()
+    return result
 
 
 if __name__ == "__main__":
-    import argparse, sys, textwrap
+    import argparse, textwrap
 
     parser = argparse.ArgumentParser(
         description="Batch substitute in Tcl highlight scripts.",
@@ -249,33 +505,38 @@ if __name__ == "__main__":
                         help="regex substitution to apply")
     parser.add_argument("-c", "--categories", nargs="*", type=int,
                         help="restrict operation to these category IDs")
+    parser.add_argument("--analyze", action="store_true",
+                        help="print the top shared name prefixes per category")
 
     args = parser.parse_args()
 
     tcl = TclScript.read(args.infile)
-    
-    for cid, cat in tcl.categories.items():
-        names = [cmd.name for cmd in cat.cmds]
-
-        substrs = shared_leading_segments([cmd.name for cmd in cat.cmds], min_len=4, min_occurs=2)
-        if substrs:
-            print(f"\nCategory {cid} top shared fragments:")
-            for frag, cnt in sorted(substrs.items(), key=lambda kv: (-kv[1], -len(kv[0]), kv[0]))[:10]:
-                print(f"   '{frag}'  ({cnt} occurrences)")
-
-
-        #prefix = os.path.commonprefix(names)
-        ## common suffix = commonprefix of the reversed strings
-        #print("\nCategory " + str(cid))
-        #print(prefix)
-        
-        #print(cid, [cmd.name for cmd in cat.cmds])
 
     if args.pattern:
         pat, repl = args.pattern
         n_subs = tcl.substitute(
-            pat, repl, category_filter=args.categories
+            re.compile(pat, 0), repl, category_filter=args.categories
         )
         print(f"Made {n_subs} substitution(s).", file=sys.stderr)
 
+    if args.analyze:
+        split_cache = {}
+        for cid, cat in tcl.categories.items():
+            names = cat.names()
+
+            substrs = shared_leading_segments(names, min_len=4, min_occurs=2,
+                                              split_cache=split_cache)
+            if substrs:
+                print(f"\nCategory {cid} top shared fragments:")
+                for frag, cnt in sorted(substrs.items(), key=lambda kv: (-kv[1], -len(kv[0]), kv[0]))[:10]:
+                    print(f"   '{frag}'  ({cnt} occurrences)")
+
+
+            #prefix = os.path.commonprefix(names)
+            ## common suffix = commonprefix of the reversed strings
+            #print("\nCategory " + str(cid))
+            #print(prefix)
+            
+            #print(cid, [cmd.name for cmd in cat.cmds])
+
     tcl.write(args.outfile)